@@ -1,15 +1,28 @@
 import streamlit as st
 import yfinance as yf
 import pandas as pd
-import pandas_ta as ta
 import numpy as np
 import datetime
-import time
 import pytz
-import json
+import orjson
 import os
+import tempfile
+import time
+import threading
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from concurrent.futures import ThreadPoolExecutor
+from streamlit_autorefresh import st_autorefresh
+
+try:
+    import numba
+    from numba import njit, prange
+    # Streamlit 於工作執行緒執行腳本；TBB 層在此情況下會卡住程序結束，優先使用 OpenMP
+    numba.config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+except ImportError:  # 未安裝 numba 時退回純 Python 執行 (結果相同，僅較慢)
+    def njit(*args, **kwargs):
+        return args[0] if args and callable(args[0]) else (lambda f: f)
+    prange = range
 
 # --- 1. 網頁設定 ---
 st.set_page_config(
@@ -26,6 +39,11 @@ st.markdown("""
     .metric-card { background-color: #f0f2f6; border-radius: 10px; padding: 15px; box-shadow: 2px 2px 5px rgba(0,0,0,0.1); }
     div.stButton > button { height: 3em; width: 100%; }
     .countdown-box { position: fixed; bottom: 10px; right: 10px; background-color: #ffffff; border: 1px solid #ddd; padding: 5px 10px; border-radius: 5px; font-size: 12px; color: #666; z-index: 999; }
+    /* 刷新倒數：動畫把整數屬性 --countdown 由 --from 遞減到 0，再以 CSS counter 顯示 */
+    @property --countdown { syntax: '<integer>'; inherits: true; initial-value: 0; }
+    @keyframes countdown-tick-0 { from { --countdown: var(--from); } to { --countdown: 0; } }
+    @keyframes countdown-tick-1 { from { --countdown: var(--from); } to { --countdown: 0; } }
+    .countdown::after { counter-reset: countdown var(--countdown); content: counter(countdown); }
     .snapshot-badge { background-color: #e3f2fd; color: #1565c0; padding: 4px 8px; border-radius: 4px; font-size: 12px; font-weight: bold; border: 1px solid #bbdefb; }
     
     /* 資金流向樣式 */
@@ -36,6 +54,20 @@ st.markdown("""
 
 # --- 3. 全域設定與股票清單 ---
 SNAPSHOT_FILE = 'market_flow_history.json'
+REFRESH_SECONDS = 60  # 自動刷新間隔
+CACHE_DIR = 'cache'  # 各標的 OHLCV 的 Parquet 快取 (cache/{ticker}.parquet)
+MAX_TICKERS_PER_REQUEST = 20  # Yahoo 單次請求的代號上限 (URL 長度限制)
+MIN_BARS = 50  # 指標計算所需的最少 K 棒數
+EPS = 1e-9  # 比值分母的防除零值 (無量視窗)
+ADJ_RTOL = 1e-4  # 重疊 K 棒收盤價的相對誤差上限，超過即視為除權息/分割後的回溯調整
+SIGNAL_LABELS = ['SELL', 'HOLD', 'BUY']  # Signal 類別，對應訊號代碼 -1/0/1 (+1 後為 category code)
+
+# 分級對照表：np.searchsorted(門檻, 數值) 即為標籤索引 (NaN 會落在最後一級，查表前須先排除)
+CMF_THRESH = np.array([-0.1, 0.0, 0.1])
+CMF_LABELS = ("主力正在出貨", "資金震盪/觀望", "資金溫和流入", "主力大舉買進")
+FLOW_TAG_THRESH = np.array([-0.05, 0.05])
+FLOW_TAGS = (" (資金出)", "", " (資金入)")
+VOL_RATIO_THRESH = np.array([0.7, 1.5])
 
 # 您指定的美股+ADR清單
 TARGET_TICKERS = sorted([
@@ -44,13 +76,19 @@ TARGET_TICKERS = sorted([
     "QQQ", "SPY", "XLV", "TEM", "TSLA", "TSM"
 ])
 
+def _load_all_snapshots():
+    """讀取全部存檔；以檔案 mtime 判斷是否變動，未變動時直接沿用 session_state 中的副本"""
+    if not os.path.exists(SNAPSHOT_FILE): return {}
+    mtime = os.path.getmtime(SNAPSHOT_FILE)
+    if st.session_state.get('snap_mtime') != mtime:
+        try:
+            with open(SNAPSHOT_FILE, 'rb') as f: st.session_state['snapshots'] = orjson.loads(f.read())
+        except: st.session_state['snapshots'] = {}
+        st.session_state['snap_mtime'] = mtime
+    return st.session_state['snapshots']
+
 def load_snapshot(ticker):
-    if not os.path.exists(SNAPSHOT_FILE): return None
-    try:
-        with open(SNAPSHOT_FILE, 'r') as f:
-            data = json.load(f)
-        return data.get(ticker)
-    except: return None
+    return _load_all_snapshots().get(ticker)
 
 def save_snapshot(ticker, price, flow_data):
     record = {
@@ -59,126 +97,348 @@ def save_snapshot(ticker, price, flow_data):
         "close_price": price,
         "flow_data": flow_data
     }
-    all_data = {}
-    if os.path.exists(SNAPSHOT_FILE):
-        try:
-            with open(SNAPSHOT_FILE, 'r') as f: all_data = json.load(f)
-        except: pass
-    all_data[ticker] = record
-    with open(SNAPSHOT_FILE, 'w') as f: json.dump(all_data, f, indent=4)
+    # 在副本上更新；寫檔成功後才替換 session_state，失敗時不會被誤認為已存檔
+    all_data = {**_load_all_snapshots(), ticker: record}
+    # 先寫暫存檔再原子替換，避免寫到一半中斷導致存檔損毀；暫存檔名各自唯一，多個 session 同時存檔不會互相覆蓋
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(SNAPSHOT_FILE)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f: f.write(orjson.dumps(all_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        os.replace(tmp_file, SNAPSHOT_FILE)
+    except:
+        if os.path.exists(tmp_file): os.remove(tmp_file)
+        raise
+    # 同步記憶體副本與 mtime，下次讀取不必重新解析
+    st.session_state['snapshots'] = all_data
+    st.session_state['snap_mtime'] = os.path.getmtime(SNAPSHOT_FILE)
     return True
 
-# --- 4. 核心運算邏輯 (資金流向版) ---
+# --- 4. 數據下載 (批次共用) ---
+def _download_batched(tickers, **kwargs):
+    """分批 (每批 ≤20 檔) 並行下載，回傳 (ticker, 欄位) 雙層欄位的 DataFrame"""
+    chunks = [tickers[i:i + MAX_TICKERS_PER_REQUEST] for i in range(0, len(tickers), MAX_TICKERS_PER_REQUEST)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as ex:
+        frames = list(ex.map(lambda c: yf.download(list(c), group_by='ticker', threads=True, progress=False, auto_adjust=True, **kwargs), chunks))
+    return pd.concat(frames, axis=1)
+
+def _period_cutoff(period):
+    """yfinance period 字串 ('3mo'、'6mo'、'1y') 對應的起始日，用來裁切快取長度"""
+    for suffix, unit in (('mo', 'months'), ('y', 'years'), ('d', 'days')):
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return pd.Timestamp.now().normalize() - pd.DateOffset(**{unit: int(period[:-len(suffix)])})
+
+def _read_cache(ticker):
+    """回傳 (快取 DataFrame, 距上次寫入秒數)；無快取或讀取失敗時回傳 (None, None)"""
+    path = os.path.join(CACHE_DIR, f"{ticker}.parquet")
+    if not os.path.exists(path): return None, None
+    try: return pd.read_parquet(path), time.time() - os.path.getmtime(path)
+    except: return None, None
+
+def _write_cache(ticker, df):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(os.path.join(CACHE_DIR, f"{ticker}.parquet"), compression='zstd')
+    except: pass  # 快取寫入失敗不影響本次結果
+
+@st.cache_data(max_entries=2)
+def fetch_bulk(tickers_tuple, refresh_key, period="6mo"):
+    """批次取得全部標的 OHLCV，單股分析與全市場掃描共用；有本地 Parquet 快取的標的只補抓尾段。
+    refresh_key 只用作快取鍵 (盤中每分鐘、休市每小時換新)，換鍵時才重新整理。
+    回傳欄位為 (欄位, ticker) 雙層：data['Close'] 即為 K 線數 × 標的數的矩陣"""
+    cached, ages = {}, {}
+    for t in tickers_tuple: cached[t], ages[t] = _read_cache(t)
+    warm = [t for t in tickers_tuple if cached[t] is not None and len(cached[t]) > 0]
+    cold = [t for t in tickers_tuple if t not in warm]
+    # 快取檔在刷新間隔內才寫入 (其他 session、重啟前的程序) 時直接沿用，不必再補抓
+    stale = [t for t in warm if ages[t] >= REFRESH_SECONDS]
+
+    frames = {t: cached[t] for t in warm}
+    updated = []  # 實際取得新資料的標的；只有這些需要裁切並寫回快取
+    if stale:
+        # 從倒數第二根 (已收定) 快取 K 棒起重抓：最後一根可能是盤中未收定的 K 棒，直接覆蓋；
+        # 倒數第二根用來比對，除權息/分割後 Yahoo 會回溯調整全部歷史價，與快取不符時改抓完整區間
+        anchor = {t: cached[t].index[max(len(cached[t]) - 2, 0)] for t in stale}
+        data = _download_batched(stale, start=min(anchor.values()).strftime('%Y-%m-%d'))
+        rebased = []
+        for t in stale:
+            new = data[t].dropna(how='all') if t in data.columns.get_level_values(0) else None
+            if new is None or len(new) == 0: continue  # 補抓失敗：沿用快取，不改寫檔案 (否則 mtime 被刷新而誤判為剛更新)
+            a = anchor[t]
+            if a in new.index and not np.isclose(new.at[a, 'Close'], cached[t].at[a, 'Close'], rtol=ADJ_RTOL):
+                rebased.append(t)
+                continue
+            df_t = pd.concat([cached[t], new])
+            frames[t] = df_t[~df_t.index.duplicated(keep='last')]
+            updated.append(t)
+        cold += rebased
+    if cold:
+        data = _download_batched(cold, period=period)
+        for t in cold:
+            # 下載失敗的標的 yfinance 回傳全 NaN 欄位：不覆蓋 (重新調整失敗時保留原快取)
+            new = data[t].dropna(how='all') if t in data.columns.get_level_values(0) else None
+            if new is not None and len(new) > 0:
+                frames[t] = new
+                updated.append(t)
+
+    cutoff = _period_cutoff(period)
+    for t in updated:
+        if cutoff is not None: frames[t] = frames[t][frames[t].index >= cutoff]
+        if len(frames[t]) > 0: _write_cache(t, frames[t])  # 不寫入空的快取檔
+    # yfinance 下載失敗不拋例外而是回傳全 NaN 欄位；有標的既無快取也沒抓到資料時主動拋出，
+    # 例外不會被 st.cache_data 快取，下一次重跑即重試 (不會把殘缺結果快取到換鍵為止)
+    missing = [t for t in tickers_tuple if t not in frames]
+    if missing: raise RuntimeError(f"無法取得行情：{', '.join(missing)}")
+    return pd.concat(frames, axis=1).swaplevel(axis=1).sort_index(axis=1)
+
+# --- 5. 核心運算邏輯 (資金流向版) ---
+@njit(cache=True, nogil=True)
+def _ema(x, length):
+    """EMA：以前 length 筆 SMA 為起點，之後 e[i] = e[i-1] + k*(x[i]-e[i-1]) (前段 NaN 自動略過)"""
+    n = len(x)
+    out = np.full(n, np.nan, x.dtype)
+    start = 0
+    while start < n and np.isnan(x[start]): start += 1
+    if start + length > n: return out
+    seed = 0.0
+    for i in range(start, start + length): seed += x[i]
+    out[start + length - 1] = seed / length
+    k = 2.0 / (length + 1)
+    for i in range(start + length, n):
+        out[i] = out[i - 1] + k * (x[i] - out[i - 1])
+    return out
+
+@njit(cache=True, nogil=True)
+def _rolling_sum(x, length):
+    """滑動視窗總和：以前綴和相減 O(N) 完成；視窗內含 NaN 時輸出 NaN"""
+    n = len(x)
+    out = np.full(n, np.nan)
+    csum = np.zeros(n + 1)
+    nan_cnt = np.zeros(n + 1, np.int64)
+    for i in range(n):
+        if np.isnan(x[i]):
+            csum[i + 1] = csum[i]
+            nan_cnt[i + 1] = nan_cnt[i] + 1
+        else:
+            csum[i + 1] = csum[i] + x[i]
+            nan_cnt[i + 1] = nan_cnt[i]
+    for i in range(length - 1, n):
+        if nan_cnt[i + 1] == nan_cnt[i + 1 - length]: out[i] = csum[i + 1] - csum[i + 1 - length]
+    return out
+
+@njit(cache=True, nogil=True)
+def _ffill(x):
+    """缺值沿用前一筆 (回傳新陣列，不改動傳入的 DataFrame 欄位)"""
+    out = x.copy()
+    for i in range(1, len(out)):
+        if np.isnan(out[i]): out[i] = out[i - 1]
+    return out
+
+@njit(cache=True, nogil=True)
+def _indicators_njit(high, low, close, vol, atr_mult):
+    """單次走訪 float32 價量陣列計算全部指標 (視窗累加維持 float64)，回傳各指標陣列與訊號代碼 (1=BUY, 0=HOLD, -1=SELL)"""
+    n = len(close)
+    high, low, close, vol = _ffill(high), _ffill(low), _ffill(close), _ffill(vol)
+
+    # 1. 均線與 MACD
+    ema8 = _ema(close, 8)
+    ema21 = _ema(close, 21)
+    macd_line = _ema(close, 12) - _ema(close, 26)
+    macd_signal = _ema(macd_line, 9)
+    macd_hist = macd_line - macd_signal
+
+    # 2. 資金流向：CMF (20 日 MFV / 成交量) 與 MFI (14 日正負資金流)
+    mfv = np.zeros(n)
+    pos_mf = np.zeros(n)
+    neg_mf = np.zeros(n)
+    tr = np.full(n, np.nan)
+    for i in range(n):
+        hl = high[i] - low[i]
+        if hl != 0: mfv[i] = ((close[i] - low[i]) - (high[i] - close[i])) / hl * vol[i]
+        if i > 0:
+            tp, tp_prev = (high[i] + low[i] + close[i]) / 3, (high[i - 1] + low[i - 1] + close[i - 1]) / 3
+            if tp > tp_prev: pos_mf[i] = tp * vol[i]
+            elif tp < tp_prev: neg_mf[i] = tp * vol[i]
+            tr[i] = max(hl, abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+    cmf = _rolling_sum(mfv, 20) / (_rolling_sum(vol, 20) + EPS)
+    pos_sum = _rolling_sum(pos_mf, 14)
+    mfi = 100 * pos_sum / (pos_sum + _rolling_sum(neg_mf, 14) + EPS)
+    vol_sma10 = _rolling_sum(vol, 10) / 10
+
+    # 3. Wilder ATR(14) 與止損：與 _ema 相同略過前段 NaN (共用索引下歷史較短的標的)，以其後前 14 筆 TR 平均為起點
+    atr = np.full(n, np.nan, close.dtype)
+    start = 0
+    while start < n and np.isnan(close[start]): start += 1
+    if start + 14 < n:
+        atr[start + 14] = np.mean(tr[start + 1:start + 15])
+        for i in range(start + 15, n): atr[i] = (atr[i - 1] * 13 + tr[i]) / 14
+    stop_loss = close - atr * atr_mult
+
+    # 4. 訊號：SELL 優先於 BUY (NaN 比較一律為 False)
+    signal_code = np.zeros(n, np.int8)
+    for i in range(1, n):
+        if close[i] < ema21[i] or macd_hist[i] < 0 or cmf[i] < -0.2:
+            signal_code[i] = -1
+        elif (close[i] > ema8[i] and ema8[i] > ema21[i] and macd_hist[i] > 0
+              and macd_hist[i] > macd_hist[i - 1] and cmf[i] > -0.05):
+            signal_code[i] = 1
+
+    return ema8, ema21, macd_line, macd_signal, macd_hist, cmf, mfi, vol_sma10, atr, stop_loss, signal_code
+
+def _run_indicators(df, atr_mult):
+    """已是 float32 的欄位直接以欄位視圖傳入 (不複製)，其他型別 (成交量) 才轉換"""
+    return _indicators_njit(
+        np.ascontiguousarray(df['High'].to_numpy(copy=False), dtype=np.float32),
+        np.ascontiguousarray(df['Low'].to_numpy(copy=False), dtype=np.float32),
+        np.ascontiguousarray(df['Close'].to_numpy(copy=False), dtype=np.float32),
+        np.ascontiguousarray(df['Volume'].to_numpy(copy=False), dtype=np.float32),
+        float(atr_mult),
+    )
+
+@njit(cache=True, nogil=True, parallel=True)
+def _scan_last_bar(high, low, close, vol):
+    """全市場掃描用：輸入 K 線數 × 標的數矩陣 (欄位連續)，各欄平行計算並只取最後一根 K 棒的訊號代碼與 CMF"""
+    n_bars, n_tickers = close.shape
+    codes = np.zeros(n_tickers, np.int8)
+    cmfs = np.full(n_tickers, np.nan)
+    valid = np.zeros(n_tickers, np.bool_)
+    for k in prange(n_tickers):
+        end = n_bars
+        if end > 0 and np.isnan(close[end - 1, k]): end -= 1  # 最後一根尚無收盤價時略過
+        if end < MIN_BARS or np.all(np.isnan(close[:end, k])): continue
+        out = _indicators_njit(high[:end, k], low[:end, k], close[:end, k], vol[:end, k], 1.0)  # 止損乘數不影響訊號
+        codes[k] = out[-1][end - 1]  # 訊號代碼
+        cmfs[k] = out[5][end - 1]  # CMF
+        valid[k] = True
+    return codes, cmfs, valid
+
 def calculate_technical_indicators(df, atr_mult):
-    """共用的技術指標與訊號計算邏輯"""
-    if len(df) < 50: return df, "數據不足"
-    df = df.ffill()
+    """單股圖表用：完整指標序列與訊號組回 DataFrame"""
+    if df['Close'].count() < MIN_BARS: return df, "數據不足"  # 以有效收盤價筆數判斷 (共用索引下缺資料的列為 NaN)
 
-    # 1. 均線與趨勢
-    df['EMA_8'] = ta.ema(df['Close'], length=8)
-    df['EMA_21'] = ta.ema(df['Close'], length=21)
-    
-    # 2. MACD
-    macd = ta.macd(df['Close'], fast=12, slow=26, signal=9)
-    if macd is not None:
-        df = pd.concat([df, macd], axis=1)
-        cols_map = {df.columns[-3]: 'MACD_Line', df.columns[-2]: 'MACD_Hist', df.columns[-1]: 'MACD_Signal'}
-        df.rename(columns=cols_map, inplace=True)
-
-    # 3. 資金流向指標 (Institutional Flow Proxies)
-    # CMF (Chaikin Money Flow): 判斷主力吸籌(>0)或派發(<0)
-    df['CMF'] = ta.cmf(df['High'], df['Low'], df['Close'], df['Volume'], length=20)
-    # MFI (Money Flow Index): 資金動能 (類似RSI但含成交量)
-    df['MFI'] = ta.mfi(df['High'], df['Low'], df['Close'], df['Volume'], length=14)
-
-    # 4. 波動率與止損
-    df['Vol_SMA_10'] = ta.sma(df['Volume'], length=10)
-    df['ATR'] = ta.atr(df['High'], df['Low'], df['Close'], length=14)
-    df['Stop_Loss'] = df['Close'] - (df['ATR'] * atr_mult)
+    (ema8, ema21, macd_line, macd_signal, macd_hist, cmf, mfi,
+     vol_sma10, atr, stop_loss, signal_code) = _run_indicators(df, atr_mult)
+
+    # 浮點指標組成單一 float32 區塊 (每列為一個指標，轉置後各欄在記憶體中連續)
+    cols = [
+        # 1. 均線與趨勢
+        'EMA_8', 'EMA_21',
+        # 2. MACD
+        'MACD_Line', 'MACD_Hist', 'MACD_Signal',
+        # 3. 資金流向指標 (Institutional Flow Proxies)
+        # CMF (Chaikin Money Flow): 判斷主力吸籌(>0)或派發(<0)
+        # MFI (Money Flow Index): 資金動能 (類似RSI但含成交量)
+        'CMF', 'MFI',
+        # 4. 波動率與止損
+        'Vol_SMA_10', 'ATR', 'Stop_Loss',
+    ]
+    block = np.vstack([
+        ema8, ema21, macd_line, macd_hist, macd_signal, cmf, mfi, vol_sma10, atr, stop_loss,
+    ]).astype(np.float32)
+    indicators = pd.DataFrame(block.T, index=df.index, columns=cols)
 
     # --- 訊號判定邏輯 ---
     # 買進：趨勢向上 + 動能增強 + 資金流入 (CMF > -0.05, 允許輕微背離但不能大出貨)
-    conditions = [
-        (df['Close'] > df['EMA_8']) & 
-        (df['EMA_8'] > df['EMA_21']) & 
-        (df['MACD_Hist'] > 0) & 
-        (df['MACD_Hist'] > df['MACD_Hist'].shift(1)) & 
-        (df['CMF'] > -0.05) # 資金面確認：主力沒有明顯出貨
-    ]
-    df['Signal'] = np.select(conditions, ['BUY'], default='HOLD')
-    
-    # 賣出：跌破均線 或 資金大幅流出 (CMF < -0.15)
-    sell_cond = (df['Close'] < df['EMA_21']) | (df['MACD_Hist'] < 0) | (df['CMF'] < -0.2)
-    df.loc[sell_cond, 'Signal'] = 'SELL'
+    # 賣出：跌破均線 或 資金大幅流出 (CMF < -0.2)
+    signal = pd.Series(pd.Categorical.from_codes(signal_code + 1, SIGNAL_LABELS), index=df.index, name='Signal')
+
+    # 以單次 concat 併回；df[cols] = 二維陣列對新欄位仍會逐欄插入，每欄各成一個區塊
+    df = pd.concat([df, indicators, signal], axis=1)
     
     return df, None
 
-@st.cache_data(ttl=60)
-def get_analysis_data(ticker, atr_mult):
-    """單一股票詳細分析"""
-    try:
-        df = yf.download(ticker, period="6mo", progress=False)
-        if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-        
-        if len(df) > 0:
-            last_row = df.iloc[-1]
-            if pd.isna(last_row['Close']): df = df.iloc[:-1]
+def _trim_trailing_nan(df):
+    """盤中最後一根 K 棒尚無收盤價時去除 (直接檢查陣列尾端，不建立整列 Series)"""
+    if len(df) > 0 and np.isnan(df['Close'].to_numpy()[-1]): return df.iloc[:-1]
+    return df
 
-        df, err = calculate_technical_indicators(df, atr_mult)
-        if err: return None, err, None
-        
-        # 提取資金流向數據
-        last = df.iloc[-1]
-        flow_data = {
-            "CMF": last['CMF'], # 資金流向
-            "MFI": last['MFI'], # 資金動能
-            "Vol_Ratio": last['Volume'] / last['Vol_SMA_10'] if last['Vol_SMA_10'] > 0 else 1.0
-        }
-        
-        return df, None, flow_data
-    except Exception as e:
-        return None, str(e), None
-
-@st.cache_data(ttl=60)
-def scan_market_summary(tickers, atr_mult):
-    """批次掃描全市場訊號 (含資金流向)"""
-    summary = {"BUY": [], "HOLD": [], "SELL": []}
+@st.cache_data(max_entries=64)
+def get_analysis_data(ticker, atr_mult, refresh_key):
+    """單一股票詳細分析；下載失敗時直接拋出例外 (st.cache_data 不快取例外，由呼叫端處理)"""
+    # 共用索引中該標的沒有交易的列 (上市較晚) 整列為 NaN，先去除
+    df = _trim_trailing_nan(fetch_bulk(tuple(TARGET_TICKERS), refresh_key).xs(ticker, axis=1, level=1).dropna(how='all'))
+    # 價格欄位先轉 float32 (成交量維持原精度)：指標核心直接取用欄位視圖，快取複製與圖表序列化的資料量也減半
+    df = df.astype(dict.fromkeys(['Open', 'High', 'Low', 'Close'], np.float32))
+
+    df, err = calculate_technical_indicators(df, atr_mult)
+    if err: return None, err, None
     
-    try:
-        data = yf.download(tickers, period="3mo", group_by='ticker', progress=False, threads=True)
-        
-        for ticker in tickers:
-            try:
-                df_t = data[ticker].copy()
-                if len(df_t) > 0:
-                    if pd.isna(df_t.iloc[-1]['Close']): df_t = df_t.iloc[:-1]
-                if df_t.empty: continue
-
-                df_t, err = calculate_technical_indicators(df_t, atr_mult)
-                if err: continue
-                
-                last = df_t.iloc[-1]
-                
-                # 簡單標註資金狀態
-                flow_status = " (資金入)" if last['CMF'] > 0.05 else " (資金出)" if last['CMF'] < -0.05 else ""
-                ticker_display = f"{ticker}{flow_status}"
-                
-                if last['Signal'] == "BUY": summary["BUY"].append(ticker_display)
-                elif last['Signal'] == "SELL": summary["SELL"].append(ticker_display)
-                else: summary["HOLD"].append(ticker_display)
-            except: continue
-                
-    except Exception as e: return None
-    return summary
-
-# --- 5. 介面佈局 ---
+    # 提取資金流向數據 (一次取出所需欄位的最後一列，不逐欄經由 Series 標籤查找)
+    cols = ['CMF', 'MFI', 'Volume', 'Vol_SMA_10']
+    last = dict(zip(cols, df[cols].to_numpy(np.float64)[-1]))
+    flow_data = {
+        "CMF": last['CMF'], # 資金流向
+        "MFI": last['MFI'], # 資金動能
+        "Vol_Ratio": last['Volume'] / last['Vol_SMA_10'] if last['Vol_SMA_10'] > 0 else 1.0
+    }
+    
+    return df, None, flow_data
+
+@st.cache_resource
+def _scan_lock():
+    """跨 session 共用的鎖：平行核心一次只由一個執行緒呼叫 (workqueue 執行緒層不支援並行呼叫)"""
+    return threading.Lock()
+
+@st.cache_resource
+def _warm_up_kernels():
+    """背景編譯 (或自磁碟快取載入) numba 核心，與首次行情下載同時進行；每個程序只執行一次"""
+    lock = _scan_lock()
+    def warm():
+        # 走與實際呼叫相同的欄位轉換路徑，參數型別 (含唯讀視圖旗標) 才會一致、不必再編譯一次
+        x = np.ones(2, np.float32)
+        _run_indicators(pd.DataFrame({'High': x, 'Low': x, 'Close': x, 'Volume': np.ones(2)}), 1.0)
+        m = np.asfortranarray(np.ones((2, 2), np.float32))  # 多檔時為 F 排列
+        with lock: _scan_last_bar(m, m, m, m)
+    thread = threading.Thread(target=warm, daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_data(max_entries=2)
+def scan_market_summary(tickers, refresh_key):
+    """批次掃描全市場訊號 (含資金流向)；下載失敗時拋出例外，不讓失敗結果被快取"""
+    buckets = ([], [], [])  # 依訊號代碼 +1 分桶：SELL / HOLD / BUY
+    
+    data = fetch_bulk(tuple(tickers), refresh_key)
+    # 各欄位取 K 線數 × 標的數矩陣 (Fortran 排列，每檔的序列在記憶體中連續)，一次算完全部標的
+    high, low, close, vol = (
+        np.asfortranarray(data[field].reindex(columns=list(tickers)).to_numpy(dtype=np.float32))
+        for field in ('High', 'Low', 'Close', 'Volume')
+    )
+    with _scan_lock():
+        codes, cmfs, valid = _scan_last_bar(high, low, close, vol)
+    
+    for ticker, signal_code, cmf, ok in zip(tickers, codes, cmfs, valid):
+        if not ok: continue
+        # 簡單標註資金狀態
+        flow_status = "" if np.isnan(cmf) else FLOW_TAGS[np.searchsorted(FLOW_TAG_THRESH, cmf)]
+        buckets[signal_code + 1].append(f"{ticker}{flow_status}")
+            
+    return dict(zip(SIGNAL_LABELS, buckets))
+
+@st.cache_resource(max_entries=32)
+def build_candle_fig(x, o, h, l, c, ema8, ema21, cmf):
+    """價量與資金流圖表；以傳入陣列內容為快取鍵，數據未變動的重跑直接沿用已建好的圖表"""
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=[0.7, 0.3])
+    # 繪製價格與均線 (均線以 WebGL 繪製)
+    fig.add_trace(go.Candlestick(x=x, open=o, high=h, low=l, close=c, name='K線'), row=1, col=1)
+    fig.add_trace(go.Scattergl(x=x, y=ema8, line=dict(color='yellow', width=1), name='EMA 8'), row=1, col=1)
+    fig.add_trace(go.Scattergl(x=x, y=ema21, line=dict(color='purple', width=1), name='EMA 21'), row=1, col=1)
+    # CMF 資金指標
+    colors = np.where(cmf >= 0, '#00c853', '#d50000')
+    fig.add_trace(go.Bar(x=x, y=cmf, marker_color=colors, name='資金流 (CMF)'), row=2, col=1)
+    fig.update_layout(height=500, xaxis_rangeslider_visible=False, margin=dict(l=0, r=0, t=0, b=0),
+                      uirevision='constant')  # 重跑時保留使用者的縮放與平移狀態
+    return fig
+
+# --- 6. 介面佈局 ---
 st.title("AlphaTrader 量化終端 (資金流向版)")
+_warm_up_kernels()
 
 # 時間設定 (美股使用美東時間)
 est = pytz.timezone('US/Eastern')
 now_est = datetime.datetime.now(est)
 is_market_open = (now_est.weekday() < 5) and (9 <= now_est.hour < 16) or (now_est.hour == 16 and now_est.minute == 0)
 is_closing_window = (now_est.hour == 15 and now_est.minute >= 55)
+# 行情快取鍵：盤中每分鐘換新；休市時每小時一次 (收盤後行情不再變動，不必每分鐘重抓)
+refresh_key = now_est.strftime('%Y-%m-%d %H:%M' if is_market_open else '%Y-%m-%d %H')
 
 with st.container():
     st.markdown('<div class="control-panel">', unsafe_allow_html=True)
@@ -200,14 +460,20 @@ with st.container():
     st.markdown('</div>', unsafe_allow_html=True)
 
 # === A. 單一股票詳細分析 ===
-df, error, flow_data = get_analysis_data(selected_ticker, atr_multiplier)
+try:
+    df, error, flow_data = get_analysis_data(selected_ticker, atr_multiplier, refresh_key)
+except Exception as e:
+    # 失敗不進快取；同時清掉可能缺標的的行情快取，下次重跑 (或按刷新) 即重新下載
+    fetch_bulk.clear()
+    df, error, flow_data = None, str(e), None
 
 if error:
     st.error(f"錯誤: {error}")
 else:
-    last = df.iloc[-1]
-    prev = df.iloc[-2]
-    signal = last['Signal']
+    cols = ['Close', 'Stop_Loss']
+    arr = df[cols].to_numpy()
+    last, prev = dict(zip(cols, arr[-1])), dict(zip(cols, arr[-2]))
+    signal = df['Signal'].iat[-1]
     
     # 自動存檔邏輯
     if is_closing_window and flow_data:
@@ -223,10 +489,8 @@ else:
 
     # 資金流向解讀
     cmf_val = flow_data['CMF']
-    if cmf_val > 0.1: flow_status = "主力大舉買進"
-    elif cmf_val > 0: flow_status = "資金溫和流入"
-    elif cmf_val > -0.1: flow_status = "資金震盪/觀望"
-    else: flow_status = "主力正在出貨"
+    # CMF 為 NaN (有效 K 棒不足 20 根) 時歸為最低一級，與原本 if/elif 的 else 分支一致
+    flow_status = CMF_LABELS[0] if np.isnan(cmf_val) else CMF_LABELS[np.searchsorted(CMF_THRESH, cmf_val)]
     
     flow_color = "inverse" if cmf_val > 0 else "normal" # 綠色流入，紅色流出
 
@@ -243,15 +507,10 @@ else:
     main_col, side_col = st.columns([2, 1])
     with main_col:
         st.subheader("📈 價量與趨勢")
-        # 繪製價格與均線
-        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=[0.7, 0.3])
-        fig.add_trace(go.Candlestick(x=df.index, open=df['Open'], high=df['High'], low=df['Low'], close=df['Close'], name='K線'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df.index, y=df['EMA_8'], line=dict(color='yellow', width=1), name='EMA 8'), row=1, col=1)
-        fig.add_trace(go.Scatter(x=df.index, y=df['EMA_21'], line=dict(color='purple', width=1), name='EMA 21'), row=1, col=1)
-        # CMF 資金指標
-        colors = ['#00c853' if v >= 0 else '#d50000' for v in df['CMF']]
-        fig.add_trace(go.Bar(x=df.index, y=df['CMF'], marker_color=colors, name='資金流 (CMF)'), row=2, col=1)
-        fig.update_layout(height=500, xaxis_rangeslider_visible=False, margin=dict(l=0, r=0, t=0, b=0))
+        fig = build_candle_fig(
+            df.index.to_numpy(), df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(), df['Close'].to_numpy(),
+            df['EMA_8'].to_numpy(), df['EMA_21'].to_numpy(), df['CMF'].to_numpy()
+        )
         st.plotly_chart(fig, use_container_width=True)
 
     with side_col:
@@ -270,9 +529,9 @@ else:
         # 3. 量能分析
         st.write("**3. 成交量能比**")
         vol_r = flow_data['Vol_Ratio']
-        if vol_r > 1.5: st.warning(f"🔥 爆量攻擊 ({vol_r:.1f}x)")
-        elif vol_r < 0.7: st.info(f"❄️ 量縮整理 ({vol_r:.1f}x)")
-        else: st.write(f"⚖️ 量能溫和 ({vol_r:.1f}x)")
+        vol_badges = ((st.info, "❄️ 量縮整理"), (st.write, "⚖️ 量能溫和"), (st.warning, "🔥 爆量攻擊"))
+        show_badge, vol_label = vol_badges[1 if np.isnan(vol_r) else np.searchsorted(VOL_RATIO_THRESH, vol_r, side='right')]
+        show_badge(f"{vol_label} ({vol_r:.1f}x)")
         
         st.markdown("---")
         st.info("💡 **解讀：** \nCMF > 0 代表機構吸籌(多頭)，CMF < 0 代表機構派發(空頭)。結合 MFI 判斷是否資金過熱。")
@@ -288,19 +547,17 @@ st.markdown("---")
 st.subheader("🌍 全市場資金流向總表 (Institutional Flow)")
 
 with st.spinner("正在掃描市場訊號..."):
-    market_signals = scan_market_summary(TARGET_TICKERS, atr_multiplier)
+    try: market_signals = scan_market_summary(TARGET_TICKERS, refresh_key)
+    except Exception:
+        fetch_bulk.clear()
+        market_signals = None
 
 if market_signals:
-    max_len = max(len(market_signals["BUY"]), len(market_signals["HOLD"]), len(market_signals["SELL"]))
-    buy_list = market_signals["BUY"] + [""] * (max_len - len(market_signals["BUY"]))
-    hold_list = market_signals["HOLD"] + [""] * (max_len - len(market_signals["HOLD"]))
-    sell_list = market_signals["SELL"] + [""] * (max_len - len(market_signals["SELL"]))
-    
-    summary_df = pd.DataFrame({
-        "BUY (資金流入)": buy_list,
-        "HOLD (觀望/震盪)": hold_list,
-        "SELL (資金流出)": sell_list
-    })
+    # 各欄長度不一，由 pandas 依位置對齊後補空字串
+    summary_df = pd.concat([
+        pd.Series(market_signals[k], name=col) for k, col in
+        [("BUY", "BUY (資金流入)"), ("HOLD", "HOLD (觀望/震盪)"), ("SELL", "SELL (資金流出)")]
+    ], axis=1).fillna("")
     
     st.dataframe(
         summary_df,
@@ -316,10 +573,11 @@ else:
     st.error("無法取得市場數據")
 
 if auto_refresh:
-    placeholder = st.empty()
-    for s in range(60, 0, -1):
-        now_str = datetime.datetime.now(est).strftime('%H:%M:%S')
-        placeholder.markdown(f'<div class="countdown-box">🕒 {now_str} | ⏳ {s}s 刷新</div>', unsafe_allow_html=True)
-        time.sleep(1)
-    placeholder.empty()
-    st.rerun()
+    # 由瀏覽器端排程重跑，不佔用 Python 執行緒；倒數也交給前端 JS 更新
+    st_autorefresh(interval=REFRESH_SECONDS * 1000, key='tick')
+    now_str = datetime.datetime.now(est).strftime('%H:%M:%S')
+    # 秒數由 CSS 動畫遞減 (見 .countdown 樣式)，不需 script；重跑時元素可能被沿用，交替動畫名稱才會重新起算
+    tick = f"countdown-tick-{st.session_state.setdefault('tick_parity', 0)}"
+    st.session_state['tick_parity'] ^= 1
+    st.markdown(f'<div class="countdown-box">🕒 {now_str} | ⏳ <span class="countdown" style="--from: {REFRESH_SECONDS}; '
+                f'animation: {tick} {REFRESH_SECONDS}s steps({REFRESH_SECONDS}) forwards"></span>s 刷新</div>', unsafe_allow_html=True)